@@ -6,11 +6,13 @@ import datetime
 import logging
 import os
 import re
+import sys
 import time
 # We can remove ExpatError when we drop support for Python 2.6:
 from xml.parsers.expat import ExpatError
 
 import requests
+from requests.adapters import HTTPAdapter
 
 try:
     from xml.etree import ElementTree as ET
@@ -26,6 +28,12 @@ try:
 except ImportError:
     import json
 
+try:
+    # Decode responses with orjson, if installed.
+    import orjson
+except ImportError:
+    orjson = None
+
 try:
     # Python 3.X
     from urllib.parse import urlencode
@@ -65,8 +73,52 @@ def get_version():
     return "%s.%s.%s" % __version__[:3]
 
 
+# Connection pool sizing for the default ``requests.Session``: the number of
+# hosts to keep pools for and the number of connections kept per host.
+POOL_CONNECTIONS = 10
+POOL_MAXSIZE = 20
+
+# Anything other than the characters ``urlencode`` never quotes.
+URL_UNSAFE_REGEX = re.compile(r'[^A-Za-z0-9_.\-]')
+ENTITY_REGEX = re.compile(r'&(#[xX]?[0-9a-fA-F]+|[A-Za-z][A-Za-z0-9]*);')
+INTEGER_REGEX = re.compile(r'^-?(0|[1-9][0-9]*)$')
+FLOAT_REGEX = re.compile(r'^-?[0-9]+\.[0-9]+$')
+
+# Matches every character ``is_valid_xml_char_ordinal`` rejects. Narrow
+# Python 2 builds store astral characters as surrogate pairs, which (just as
+# ``is_valid_xml_char_ordinal`` would) get stripped.
+if sys.maxunicode > 0xFFFF:
+    INVALID_XML_CHARS_REGEX = re.compile('[^\x09\x0a\x0d\x20-\ud7ff\ue000-\ufffd\U00010000-\U0010ffff]')
+else:
+    INVALID_XML_CHARS_REGEX = re.compile('[^\x09\x0a\x0d\x20-\ud7ff\ue000-\ufffd]')
+
+# Used to pull error messages out of the HTML pages servlet containers send
+# back, which is much cheaper than parsing the (often large) page.
+HTML_TITLE_REGEX = re.compile(r'<title[^>]*>(.*?)</title>', re.IGNORECASE | re.DOTALL)
+HTML_PRE_REGEX = re.compile(r'<pre[^>]*>(.*?)</pre>', re.IGNORECASE | re.DOTALL)
+HTML_H1_REGEX = re.compile(r'<(h1)[^>]*>\s*(.+?)\s*</\1>', re.IGNORECASE)
+HTML_NOISE_REGEX = re.compile(r'\n|\r|<br ?/>')
+
 DATETIME_REGEX = re.compile('^(?P<year>\d{4})-(?P<month>\d{2})-(?P<day>\d{2})T(?P<hour>\d{2}):(?P<minute>\d{2}):(?P<second>\d{2})(\.\d+)?Z$')
 
+# Each ``Solr`` instance remembers what short strings converted to, as long as
+# the result is immutable. Its cache is simply emptied once it fills up.
+TO_PYTHON_CACHE_SIZE = 4096
+TO_PYTHON_CACHE_MAX_LENGTH = 256
+TO_PYTHON_CACHE_TYPES = (bool, int, long, float, complex, type(''), datetime.datetime, type(None))
+
+# Converters for the exact types ``Solr._from_python`` sees most, which lets it
+# skip its chain of ``hasattr``/``isinstance`` checks with one dict lookup.
+FROM_PYTHON_CONVERTERS = {
+    datetime.datetime: lambda value: "%sZ" % value.isoformat(),
+    datetime.date: lambda value: "%sT00:00:00Z" % value.isoformat(),
+    bool: lambda value: 'true' if value else 'false',
+    int: '{0}'.format,
+    long: '{0}'.format,
+    float: '{0}'.format,
+    type(''): lambda value: value,
+}
+
 
 class NullHandler(logging.Handler):
     def emit(self, record):
@@ -97,6 +149,17 @@ def is_py3():
 IS_PY3 = is_py3()
 
 
+# Named HTML entities, mapped straight to the characters they stand for.
+try:
+    # Python 3.3+: the full HTML5 set, keyed with the trailing semicolon.
+    HTML_ENTITIES = dict((name[:-1], value)
+                         for name, value in htmlentities.html5.items()
+                         if name.endswith(';'))
+except AttributeError:
+    HTML_ENTITIES = dict((name, unicode_char(codepoint))
+                         for name, codepoint in htmlentities.name2codepoint.items())
+
+
 def force_unicode(value):
     """
     Forces a bytestring to become a Unicode string.
@@ -140,25 +203,24 @@ def unescape_html(text):
 
     Source: http://effbot.org/zone/re-sub.htm#unescape-html
     """
+    if '&' not in text:
+        # Nothing to unescape, which is the usual case.
+        return text
+
     def fixup(m):
-        text = m.group(0)
-        if text[:2] == "&#":
+        entity = m.group(1)
+        if entity[0] == "#":
             # character reference
             try:
-                if text[:3] == "&#x":
-                    return unicode_char(int(text[3:-1], 16))
+                if entity[1] in "xX":
+                    return unicode_char(int(entity[2:], 16))
                 else:
-                    return unicode_char(int(text[2:-1]))
-            except ValueError:
-                pass
-        else:
-            # named entity
-            try:
-                text = unicode_char(htmlentities.name2codepoint[text[1:-1]])
-            except KeyError:
-                pass
-        return text # leave as is
-    return re.sub("&#?\w+;", fixup, text)
+                    return unicode_char(int(entity[1:]))
+            except (ValueError, OverflowError):
+                return m.group(0) # leave as is
+        # named entity, or leave as is
+        return HTML_ENTITIES.get(entity, m.group(0))
+    return ENTITY_REGEX.sub(fixup, text)
 
 
 def safe_urlencode(params, doseq=0):
@@ -168,23 +230,58 @@ def safe_urlencode(params, doseq=0):
     The stdlib safe_urlencode prior to Python 3.x chokes on UTF-8 values
     which can't fail down to ascii.
     """
-    if IS_PY3:
-        return urlencode(params, doseq)
-
     if hasattr(params, "items"):
         params = params.items()
 
-    new_params = list()
+    if IS_PY3:
+        pairs = []
+
+        for k, v in params:
+            # Most params (field names, ids, numbers, etc.) need no quoting,
+            # so only hand the rest over to ``urlencode``.
+            if (isinstance(k, str) and isinstance(v, str)
+                    and not URL_UNSAFE_REGEX.search(k)
+                    and not URL_UNSAFE_REGEX.search(v)):
+                pairs.append('%s=%s' % (k, v))
+            else:
+                encoded = urlencode(((k, v),), doseq)
+
+                if encoded:
+                    pairs.append(encoded)
 
-    for k, v in params:
-        k = k.encode("utf-8")
+        return '&'.join(pairs)
+
+    return urlencode([(k.encode("utf-8"),
+                       [force_bytes(i) for i in v] if isinstance(v, (list, tuple)) else force_bytes(v))
+                      for k, v in params], doseq)
+
+
+def xml_quote(value):
+    """
+    Escapes a Unicode string for use as XML text or as a double-quoted
+    attribute value.
+
+    Unlike ``xml_escape``, characters XML doesn't allow are left alone, so
+    this is only for strings which have already been cleaned.
+    """
+    # Chained ``replace`` calls beat ``translate`` here, as most values don't
+    # contain any of these characters and come back untouched.
+    return (value
+            .replace('&', '&amp;')
+            .replace('<', '&lt;')
+            .replace('>', '&gt;')
+            .replace('"', '&quot;'))
 
-        if isinstance(v, (list, tuple)):
-            new_params.append((k, [force_bytes(i) for i in v]))
-        else:
-            new_params.append((k, force_bytes(v)))
 
-    return urlencode(new_params, doseq)
+def xml_escape(value):
+    """
+    Escapes a Unicode string for use as XML text or as a double-quoted
+    attribute value, dropping any characters XML doesn't allow.
+
+    Output built from this is already clean, so it doesn't need another
+    ``sanitize`` pass.
+    """
+    return xml_quote(INVALID_XML_CHARS_REGEX.sub('', value))
 
 
 def is_valid_xml_char_ordinal(i):
@@ -211,7 +308,21 @@ def clean_xml_string(s):
 
     http://stackoverflow.com/questions/8733233/filtering-out-certain-bytes-in-python
     """
-    return ''.join(c for c in s if is_valid_xml_char_ordinal(ord(c)))
+    return INVALID_XML_CHARS_REGEX.sub('', s)
+
+
+def get_session():
+    """
+    Builds a ``requests.Session`` whose connections are pooled and reused
+    across requests to the same Solr host.
+    """
+    session = requests.Session()
+    session.stream = False
+    adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS,
+                          pool_maxsize=POOL_MAXSIZE)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
 
 
 class SolrError(Exception):
@@ -219,6 +330,11 @@ class SolrError(Exception):
 
 
 class Results(object):
+    # Saves a ``__dict__`` per instance. Subclasses still get one unless they
+    # declare ``__slots__`` of their own.
+    __slots__ = ('docs', 'hits', 'highlighting', 'facets', 'spellcheck',
+                 'stats', 'qtime', 'debug', 'grouped', 'nextCursorMark')
+
     def __init__(self, docs, hits, highlighting=None, facets=None,
                  spellcheck=None, stats=None, qtime=None, debug=None,
                  grouped=None, nextCursorMark=None):
@@ -233,6 +349,14 @@ class Results(object):
         self.grouped = grouped or {}
         self.nextCursorMark = nextCursorMark or None
 
+    def __getstate__(self):
+        # Slotted classes need these to be picklable with protocols 0 and 1.
+        return dict((name, getattr(self, name)) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
     def __len__(self):
         return len(self.docs)
 
@@ -245,11 +369,16 @@ class Solr(object):
     The main object for working with Solr.
 
     Optionally accepts ``decoder`` for an alternate JSON decoder instance.
-    Default is ``json.JSONDecoder()``.
+    Default is ``json.JSONDecoder()``, though responses are parsed with
+    ``orjson`` instead when it is installed.
 
     Optionally accepts ``timeout`` for wait seconds until giving up on a
     request. Default is ``60`` seconds.
 
+    Optionally accepts ``session`` for a preconfigured ``requests.Session``
+    (auth, proxies, adapters, etc.). Default is a new session with a pooled
+    ``HTTPAdapter``, so connections are kept alive between requests.
+
     Usage::
 
         solr = pysolr.Solr('http://localhost:8983/solr')
@@ -257,13 +386,14 @@ class Solr(object):
         solr = pysolr.Solr('http://localhost:8983/solr', timeout=10)
 
     """
-    def __init__(self, url, decoder=None, timeout=60):
+    def __init__(self, url, decoder=None, timeout=60, session=None):
         self.decoder = decoder or json.JSONDecoder()
+        self.use_orjson = decoder is None and orjson is not None
         self.url = url
         self.timeout = timeout
         self.log = self._get_log()
-        self.session = requests.Session()
-        self.session.stream = False
+        self.session = session or get_session()
+        self.to_python_cache = {}
 
     def _get_log(self):
         return LOG
@@ -278,22 +408,30 @@ class Solr(object):
     def _send_request(self, method, path='', body=None, headers=None, files=None):
         url = self._create_full_url(path)
         method = method.lower()
-        log_body = body
 
         if headers is None:
             headers = {}
 
-        if log_body is None:
-            log_body = ''
-        elif not isinstance(log_body, str):
-            log_body = repr(body)
+        # Only pay for building the log messages (and timing the request)
+        # when somebody is going to see them.
+        log_request = self.log.isEnabledFor(logging.INFO)
+
+        if log_request:
+            if body is None:
+                log_body = ''
+            elif isinstance(body, (bytes, type(''))):
+                # Slice before converting, as bodies can be huge and only
+                # their start gets logged.
+                log_body = force_unicode(body[:10])
+            else:
+                log_body = repr(body)[:10]
 
-        self.log.debug("Starting request to '%s' (%s) with body '%s'...",
-                       url, method, log_body[:10])
-        start_time = time.time()
+            self.log.debug("Starting request to '%s' (%s) with body '%s'...",
+                           url, method, log_body)
+            start_time = time.time()
 
         try:
-            requests_method = getattr(self.session, method, 'get')
+            requests_method = getattr(self.session, method)
         except AttributeError as err:
             raise SolrError("Unable to send HTTP method '{0}.".format(method))
 
@@ -321,11 +459,12 @@ class Solr(object):
             self.log.error(error_message, method, url, err, exc_info=True)
             raise SolrError(error_message % (method, url, err))
 
-        end_time = time.time()
-        self.log.info("Finished '%s' (%s) with body '%s' in %0.3f seconds.",
-                      url, method, log_body[:10], end_time - start_time)
+        if log_request:
+            end_time = time.time()
+            self.log.info("Finished '%s' (%s) with body '%s' in %0.3f seconds.",
+                          url, method, log_body, end_time - start_time)
 
-        if int(resp.status_code) != 200:
+        if resp.status_code != 200:
             error_message = self._extract_error(resp)
             self.log.error(error_message, extra={'data': {'headers': resp.headers,
                                                           'response': resp.content}})
@@ -399,6 +538,21 @@ class Solr(object):
 
         return self._send_request('post', path, message, {'Content-type': 'text/xml; charset=utf-8'})
 
+    def _decode_response(self, response):
+        """
+        Decodes the JSON body of a Solr response.
+
+        Anything ``orjson`` rejects (such as the ``NaN`` the stats component
+        can return) is retried with ``self.decoder``.
+        """
+        if self.use_orjson:
+            try:
+                return orjson.loads(response)
+            except ValueError:
+                pass
+
+        return self.decoder.decode(response)
+
     def _extract_error(self, resp):
         """
         Extract the actual error message from a solr response.
@@ -469,12 +623,23 @@ class Solr(object):
 
         if server_type == 'tomcat':
             # Tomcat doesn't produce a valid XML response or consistent HTML:
-            m = re.search(r'<(h1)[^>]*>\s*(.+?)\s*</\1>', response, re.IGNORECASE)
+            m = HTML_H1_REGEX.search(response)
             if m:
                 reason = m.group(2)
             else:
                 full_html = "%s" % response
         else:
+            # html page might be different for every server
+            if server_type == 'jetty':
+                m = HTML_PRE_REGEX.search(response)
+            else:
+                m = HTML_TITLE_REGEX.search(response)
+
+            # A plain-text match is all we're after, so skip building a DOM
+            # of the whole page.
+            if m and m.group(1) and '<' not in m.group(1):
+                return unescape_html(m.group(1)), ''
+
             # Let's assume others do produce a valid XML response
             try:
                 dom_tree = ET.fromstring(response)
@@ -495,10 +660,7 @@ class Solr(object):
                 full_html = "%s" % response
 
         full_html = force_unicode(full_html)
-        full_html = full_html.replace('\n', '')
-        full_html = full_html.replace('\r', '')
-        full_html = full_html.replace('<br/>', '')
-        full_html = full_html.replace('<br />', '')
+        full_html = HTML_NOISE_REGEX.sub('', full_html)
         full_html = full_html.strip()
         return reason, full_html
 
@@ -509,7 +671,11 @@ class Solr(object):
         Converts python values to a form suitable for insertion into the xml
         we send to solr.
         """
-        if hasattr(value, 'strftime'):
+        converter = FROM_PYTHON_CONVERTERS.get(type(value))
+
+        if converter is not None:
+            value = converter(value)
+        elif hasattr(value, 'strftime'):
             if hasattr(value, 'hour'):
                 value = "%sZ" % value.isoformat()
             else:
@@ -536,6 +702,12 @@ class Solr(object):
     def _to_python(self, value):
         """
         Converts values from Solr to native Python values.
+
+        Short strings are converted by ``_string_to_python`` once per instance
+        and served from ``self.to_python_cache`` afterwards, so it isn't called
+        again for a repeated value. Overriding ``_string_to_python`` alone
+        isn't enough if a conversion must run every time; override this
+        method instead.
         """
         if isinstance(value, (int, float, long, complex)):
             return value
@@ -564,6 +736,45 @@ class Solr(object):
                 is_string = True
 
         if is_string == True:
+            # Repeated values (facets, tags, dates...) are common, so short
+            # strings are only converted once.
+            cache = self.to_python_cache
+
+            try:
+                return cache[value]
+            except KeyError:
+                pass
+
+            converted_value = self._string_to_python(value)
+
+            # Only immutable results can safely be handed out more than once.
+            if len(value) <= TO_PYTHON_CACHE_MAX_LENGTH and type(converted_value) in TO_PYTHON_CACHE_TYPES:
+                if len(cache) >= TO_PYTHON_CACHE_SIZE:
+                    cache.clear()
+
+                cache[value] = converted_value
+
+            return converted_value
+
+        return value
+
+    def _string_to_python(self, value):
+        """
+        Converts a Unicode string from Solr to a native Python value.
+        """
+        # Solr's usual ``YYYY-MM-DDTHH:MM:SSZ`` dates can be sliced apart
+        # directly; anything fancier is left to ``DATETIME_REGEX``.
+        if (len(value) == 20 and value[19] == 'Z' and value[10] == 'T'
+                and value[4] == value[7] == '-' and value[13] == value[16] == ':'):
+            digits = value[0:4] + value[5:7] + value[8:10] + value[11:13] + value[14:16] + value[17:19]
+
+            if digits.isdecimal():
+                return datetime.datetime(int(digits[0:4]), int(digits[4:6]), int(digits[6:8]), int(digits[8:10]), int(digits[10:12]), int(digits[12:14]))
+
+        # Only dates with fractional seconds (or a trailing newline, which
+        # ``$`` also matches before) are left for the regex, and those are
+        # always longer than 20 characters and end in a ``Z``.
+        if len(value) > 20 and value.endswith(('Z', 'Z\n')):
             possible_datetime = DATETIME_REGEX.search(value)
 
             if possible_datetime:
@@ -575,6 +786,14 @@ class Solr(object):
                 return datetime.datetime(date_values['year'], date_values['month'], date_values['day'], date_values['hour'], date_values['minute'], date_values['second'])
 
         try:
+            # Plain numbers are by far the most common literals, so convert
+            # them directly rather than parsing them with ``literal_eval``.
+            if INTEGER_REGEX.match(value):
+                return int(value)
+
+            if FLOAT_REGEX.match(value):
+                return float(value)
+
             # This is slightly gross but it's hard to tell otherwise what the
             # string's original type might have been.
             return ast.literal_eval(value)
@@ -634,7 +853,7 @@ class Solr(object):
         response = self._select(params)
 
         # TODO: make result retrieval lazy and allow custom result objects
-        result = self.decoder.decode(response)
+        result = self._decode_response(response)
         result_kwargs = {}
 
         if result.get('debug'):
@@ -684,7 +903,7 @@ class Solr(object):
         params.update(kwargs)
         response = self._mlt(params)
 
-        result = self.decoder.decode(response)
+        result = self._decode_response(response)
 
         if result['response'] is None:
             result['response'] = {
@@ -710,7 +929,7 @@ class Solr(object):
         }
         params.update(kwargs)
         response = self._suggest_terms(params)
-        result = self.decoder.decode(response)
+        result = self._decode_response(response)
         terms = result.get("terms", {})
         res = {}
 
@@ -723,14 +942,10 @@ class Solr(object):
             terms = dict(zip(terms[0::2], terms[1::2]))
 
         for field, values in terms.items():
-            tmp = list()
+            res[field] = list(zip(values[0::2], values[1::2]))
 
-            while values:
-                tmp.append((values.pop(0), values.pop(0)))
-
-            res[field] = tmp
-
-        self.log.debug("Found '%d' Term suggestions results.", sum(len(j) for i, j in res.items()))
+        if self.log.isEnabledFor(logging.DEBUG):
+            self.log.debug("Found '%d' Term suggestions results.", sum(len(j) for i, j in res.items()))
         return res
 
     def _build_doc(self, doc, boost=None, fieldUpdates=None):
@@ -766,6 +981,53 @@ class Solr(object):
 
         return doc_elem
 
+    def _build_doc_xml(self, doc, boost=None, fieldUpdates=None):
+        """
+        Serializes a document to the same XML as ``_build_doc``, but without
+        building an ``ElementTree`` along the way.
+
+        ``add`` uses this unless a subclass overrides ``_build_doc``, in which
+        case the overridden ``_build_doc`` is used instead.
+        """
+        doc_attrs = ''
+        fields = []
+        is_null_value = self._is_null_value
+        from_python = self._from_python
+
+        if type(self)._from_python == Solr._from_python:
+            # ``_from_python`` has already dropped invalid characters.
+            escape_value = xml_quote
+        else:
+            # A subclass' ``_from_python`` may not have, so strip them here.
+            escape_value = xml_escape
+
+        for key, value in doc.items():
+            if key == 'boost':
+                doc_attrs = ' boost="%s"' % xml_escape(force_unicode(value))
+                continue
+
+            # To avoid multiple code-paths we'd like to treat all of our values as iterables:
+            if isinstance(value, (list, tuple)):
+                values = value
+            else:
+                values = (value, )
+
+            field_attrs = ' name="%s"' % xml_escape(force_unicode(key))
+
+            if fieldUpdates and key in fieldUpdates:
+                field_attrs += ' update="%s"' % xml_escape(force_unicode(fieldUpdates[key]))
+
+            if boost and key in boost:
+                field_attrs += ' boost="%s"' % xml_escape(force_unicode(boost[key]))
+
+            for bit in values:
+                if is_null_value(bit):
+                    continue
+
+                fields.append('<field%s>%s</field>' % (field_attrs, escape_value(from_python(bit))))
+
+        return '<doc%s>%s</doc>' % (doc_attrs, ''.join(fields))
+
     def add(self, docs, boost=None, fieldUpdates=None, commit=True, softCommit=False, commitWithin=None, waitFlush=None, waitSearcher=None):
         """
         Adds or updates documents.
@@ -800,24 +1062,93 @@ class Solr(object):
                 },
             ])
         """
-        start_time = time.time()
-        self.log.debug("Starting to build add request...")
-        message = ET.Element('add')
+        log_build = self.log.isEnabledFor(logging.DEBUG)
+
+        if log_build:
+            start_time = time.time()
+            self.log.debug("Starting to build add request...")
 
         if commitWithin:
-            message.set('commitWithin', commitWithin)
+            add_tag = '<add commitWithin="%s">' % xml_escape(force_unicode(commitWithin))
+        else:
+            add_tag = '<add>'
+
+        message = [add_tag.encode('utf-8')]
+
+        if type(self)._build_doc == Solr._build_doc:
+            # Serializing straight to strings avoids allocating an Element per
+            # field, which dominates the cost of building large batches.
+            # Encoding each document as we go means we never hold a full-size
+            # Unicode copy of the message next to the bytes we actually send.
+            message.extend(self._build_doc_xml(doc, boost=boost, fieldUpdates=fieldUpdates).encode('utf-8') for doc in docs)
+            # Everything in the message went through ``xml_escape`` or
+            # ``_from_python``, so there are no control characters left for
+            # ``_update`` to strip.
+            clean_ctrl_chars = False
+        else:
+            # A subclass has customised ``_build_doc``, so its elements are
+            # what gets sent.
+            message.extend(ET.tostring(self._build_doc(doc, boost=boost, fieldUpdates=fieldUpdates)) for doc in docs)
+            clean_ctrl_chars = True
+
+        message.append(b'</add>')
+        m = b''.join(message)
+
+        if log_build:
+            end_time = time.time()
+            self.log.debug("Built add request of %s docs in %0.2f seconds.", len(message) - 2, end_time - start_time)
+
+        return self._update(m, clean_ctrl_chars=clean_ctrl_chars, commit=commit, softCommit=softCommit, waitFlush=waitFlush, waitSearcher=waitSearcher)
+
+    def add_many(self, batches, workers=8, boost=None, fieldUpdates=None, commit=True, softCommit=False, commitWithin=None, waitFlush=None, waitSearcher=None):
+        """
+        Adds or updates several batches of documents in parallel.
+
+        Requires ``batches``, which is an iterable of lists of documents, as
+        accepted by ``add``. Each batch is posted as its own request, up to
+        ``workers`` of them at a time over the shared session, and a single
+        commit follows once all of them have been sent.
+
+        Returns a list of the responses, one per batch.
+
+        Optionally accepts ``workers``. Default is ``8``.
+
+        Optionally accepts ``commit``. Default is ``True``.
+
+        Optionally accepts ``softCommit``. Default is ``False``.
+
+        Optionally accepts ``boost``. Default is ``None``.
+
+        Optionally accepts ``fieldUpdates``. Default is ``None``.
+
+        Optionally accepts ``commitWithin``. Default is ``None``.
+
+        Optionally accepts ``waitFlush``. Default is ``None``.
 
-        for doc in docs:
-            message.append(self._build_doc(doc, boost=boost, fieldUpdates=fieldUpdates))
+        Optionally accepts ``waitSearcher``. Default is ``None``.
+
+        Usage::
+
+            solr.add_many(docs[i:i + 1000] for i in range(0, len(docs), 1000))
+        """
+        # Imported here so that importing pysolr doesn't pull in multiprocessing.
+        from multiprocessing.pool import ThreadPool
+
+        def add_batch(batch):
+            return self.add(batch, boost=boost, fieldUpdates=fieldUpdates, commit=False, commitWithin=commitWithin)
+
+        pool = ThreadPool(workers)
+
+        try:
+            responses = pool.map(add_batch, batches)
+        finally:
+            pool.close()
+            pool.join()
 
-        # This returns a bytestring. Ugh.
-        m = ET.tostring(message, encoding='utf-8')
-        # Convert back to Unicode please.
-        m = force_unicode(m)
+        if commit:
+            self.commit(softCommit=softCommit, waitFlush=waitFlush, waitSearcher=waitSearcher)
 
-        end_time = time.time()
-        self.log.debug("Built add request of %s docs in %0.2f seconds.", len(message), end_time - start_time)
-        return self._update(m, commit=commit, softCommit=softCommit, waitFlush=waitFlush, waitSearcher=waitSearcher)
+        return responses
 
     def delete(self, id=None, q=None, commit=True, waitFlush=None, waitSearcher=None):
         """
@@ -872,7 +1203,8 @@ class Solr(object):
         else:
             msg = '<commit />'
 
-        return self._update(msg, softCommit=softCommit, waitFlush=waitFlush, waitSearcher=waitSearcher)
+        # We built the message ourselves, so there's nothing to sanitize.
+        return self._update(msg, clean_ctrl_chars=False, softCommit=softCommit, waitFlush=waitFlush, waitSearcher=waitSearcher)
 
     def optimize(self, waitFlush=None, waitSearcher=None, maxSegments=None):
         """
@@ -895,7 +1227,8 @@ class Solr(object):
         else:
             msg = '<optimize />'
 
-        return self._update(msg, waitFlush=waitFlush, waitSearcher=waitSearcher)
+        # We built the message ourselves, so there's nothing to sanitize.
+        return self._update(msg, clean_ctrl_chars=False, waitFlush=waitFlush, waitSearcher=waitSearcher)
 
     def extract(self, file_obj, extractOnly=True, **kwargs):
         """
@@ -943,7 +1276,7 @@ class Solr(object):
             raise
 
         try:
-            data = json.loads(resp)
+            data = self._decode_response(resp)
         except ValueError as err:
             self.log.error("Failed to load JSON response: %s", err,
                            exc_info=True)
@@ -956,12 +1289,33 @@ class Solr(object):
 
         if raw_metadata:
             # The raw format is somewhat annoying: it's a flat list of
-            # alternating keys and value lists
-            while raw_metadata:
-                metadata[raw_metadata.pop()] = raw_metadata.pop()
+            # alternating keys and value lists. Pair them up back to front so
+            # the first occurrence of a repeated key still wins.
+            metadata.update(zip(raw_metadata[-2::-2], raw_metadata[-1::-2]))
 
         return data
 
+    def close(self):
+        """
+        Closes the underlying session, releasing any pooled connections.
+
+        Usage::
+
+            solr.close()
+
+            # Or let a ``with`` block do it.
+            with pysolr.Solr('http://localhost:8983/solr') as solr:
+                solr.search('*:*')
+
+        """
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
 
 class SolrCoreAdmin(object):
     """
@@ -978,11 +1332,13 @@ class SolrCoreAdmin(object):
        8. LOAD (not currently implemented)
     """
     def __init__(self, url, *args, **kwargs):
+        session = kwargs.pop('session', None)
         super(SolrCoreAdmin, self).__init__(*args, **kwargs)
         self.url = url
+        self.session = session or get_session()
 
     def _get_url(self, url, params={}, headers={}):
-        resp = requests.get(url, data=safe_urlencode(params), headers=headers)
+        resp = self.session.get(url, data=safe_urlencode(params), headers=headers)
         return force_unicode(resp.content)
 
     def status(self, core=None):
@@ -1049,45 +1405,25 @@ class SolrCoreAdmin(object):
     def load(self, core):
         raise NotImplementedError('Solr 1.4 and below do not support this operation.')
 
+    def close(self):
+        """
+        Closes the underlying session, releasing any pooled connections.
+        """
+        self.session.close()
 
-# Using two-tuples to preserve order.
-REPLACEMENTS = (
-    # Nuke nasty control characters.
-    (b'\x00', b''), # Start of heading
-    (b'\x01', b''), # Start of heading
-    (b'\x02', b''), # Start of text
-    (b'\x03', b''), # End of text
-    (b'\x04', b''), # End of transmission
-    (b'\x05', b''), # Enquiry
-    (b'\x06', b''), # Acknowledge
-    (b'\x07', b''), # Ring terminal bell
-    (b'\x08', b''), # Backspace
-    (b'\x0b', b''), # Vertical tab
-    (b'\x0c', b''), # Form feed
-    (b'\x0e', b''), # Shift out
-    (b'\x0f', b''), # Shift in
-    (b'\x10', b''), # Data link escape
-    (b'\x11', b''), # Device control 1
-    (b'\x12', b''), # Device control 2
-    (b'\x13', b''), # Device control 3
-    (b'\x14', b''), # Device control 4
-    (b'\x15', b''), # Negative acknowledge
-    (b'\x16', b''), # Synchronous idle
-    (b'\x17', b''), # End of transmission block
-    (b'\x18', b''), # Cancel
-    (b'\x19', b''), # End of medium
-    (b'\x1a', b''), # Substitute character
-    (b'\x1b', b''), # Escape
-    (b'\x1c', b''), # File separator
-    (b'\x1d', b''), # Group separator
-    (b'\x1e', b''), # Record separator
-    (b'\x1f', b''), # Unit separator
-)
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
-def sanitize(data):
-    fixed_string = force_bytes(data)
 
-    for bad, good in REPLACEMENTS:
-        fixed_string = fixed_string.replace(bad, good)
+# Nuke nasty control characters. XML forbids everything below 0x20 except for
+# tab (0x09), line feed (0x0a) and carriage return (0x0d).
+CONTROL_CHARS = bytes(bytearray(i for i in range(0x20) if i not in (0x09, 0x0a, 0x0d)))
 
+def sanitize(data):
+    fixed_string = force_bytes(data)
+    # A single C-level pass which deletes every byte in ``CONTROL_CHARS``.
+    fixed_string = fixed_string.translate(None, CONTROL_CHARS)
     return force_unicode(fixed_string)
@@ -2,11 +2,17 @@
 from __future__ import unicode_literals
 
 import datetime
+import logging
+import math
+import pickle
 import sys
 
-from pysolr import (Solr, Results, SolrError, unescape_html, safe_urlencode,
-                    force_unicode, force_bytes, sanitize, json, ET, IS_PY3,
-                    clean_xml_string)
+import requests
+
+import pysolr
+from pysolr import (Solr, SolrCoreAdmin, Results, SolrError, unescape_html,
+                    safe_urlencode, force_unicode, force_bytes, sanitize, json,
+                    ET, IS_PY3, clean_xml_string, xml_escape, xml_quote)
 
 try:
     import unittest2 as unittest
@@ -30,14 +36,31 @@ class UtilsTestCase(unittest.TestCase):
         self.assertEqual(unescape_html('Hello &#x64; world'), 'Hello d world')
         self.assertEqual(unescape_html('Hello &amp; ☃'), 'Hello & ☃')
         self.assertEqual(unescape_html('Hello &doesnotexist; world'), 'Hello &doesnotexist; world')
+        self.assertEqual(unescape_html('Hello &#X64; world'), 'Hello d world')
+        # Out of range references are left alone rather than blowing up.
+        self.assertEqual(unescape_html('Hello &#x110000; &#99999999999999999999; world'), 'Hello &#x110000; &#99999999999999999999; world')
+
+        if IS_PY3:
+            # HTML5-only entities.
+            self.assertEqual(unescape_html('Hello &bigstar; &NotEqualTilde; world'), 'Hello \u2605 \u2242\u0338 world')
+
+    def test_unescape_html_dense(self):
+        self.assertEqual(unescape_html('a&nbsp;b&mdash;c&amp;&lt;d&gt;' * 1000), 'a\xa0b\u2014c&<d>' * 1000)
+        # Back to back and unterminated references.
+        self.assertEqual(unescape_html('&amp;&amp;amp;&#38;&#x26;&'), '&&amp;&&&')
+        self.assertEqual(unescape_html('&amp &lt &nbsp'), '&amp &lt &nbsp')
 
     def test_safe_urlencode(self):
         self.assertEqual(force_unicode(unquote_plus(safe_urlencode({'test': 'Hello ☃! Helllo world!'}))), 'test=Hello ☃! Helllo world!')
         self.assertEqual(force_unicode(unquote_plus(safe_urlencode({'test': ['Hello ☃!', 'Helllo world!']}, True))), "test=Hello \u2603!&test=Helllo world!")
         self.assertEqual(force_unicode(unquote_plus(safe_urlencode({'test': ('Hello ☃!', 'Helllo world!')}, True))), "test=Hello \u2603!&test=Helllo world!")
+        # Params which need no quoting keep their place among those which do.
+        self.assertEqual(safe_urlencode([('q', 'title:doc'), ('wt', 'json'), ('fq', ['a b', 'c']), ('rows', 10)], True), 'q=title%3Adoc&wt=json&fq=a+b&fq=c&rows=10')
 
     def test_sanitize(self):
         self.assertEqual(sanitize('\x00\x01\x02\x03\x04\x05\x06\x07\x08\x0b\x0c\x0e\x0f\x10\x11\x12\x13\x14\x15\x16\x17\x18\x19h\x1ae\x1bl\x1cl\x1do\x1e\x1f'), 'hello'),
+        # Bytestrings are accepted too, and tabs/newlines survive.
+        self.assertEqual(sanitize(b'\x00h\te\nl\rl\x7fo \xe2\x98\x83\x1f'), 'h\te\nl\rl\x7fo ☃')
 
     def test_force_unicode(self):
         self.assertEqual(force_unicode(b'Hello \xe2\x98\x83'), 'Hello ☃')
@@ -56,6 +79,15 @@ class UtilsTestCase(unittest.TestCase):
     def test_clean_xml_string(self):
         self.assertEqual(clean_xml_string('\x00\x0b\x0d\uffff'), '\x0d')
 
+    def test_xml_quote(self):
+        self.assertEqual(xml_quote('Hello ☃'), 'Hello ☃')
+        self.assertEqual(xml_quote('<a href="?a=1&b=2">'), '&lt;a href=&quot;?a=1&amp;b=2&quot;&gt;')
+
+    def test_xml_escape(self):
+        self.assertEqual(xml_escape('Hello ☃'), 'Hello ☃')
+        self.assertEqual(xml_escape('<a href="?a=1&b=2">'), '&lt;a href=&quot;?a=1&amp;b=2&quot;&gt;')
+        self.assertEqual(xml_escape('\x00\x01te\x0bst\uffff\n'), 'test\n')
+
 
 class ResultsTestCase(unittest.TestCase):
     def test_init(self):
@@ -107,6 +139,18 @@ class ResultsTestCase(unittest.TestCase):
         self.assertEqual(to_iter[1], {'id': 2})
         self.assertEqual(to_iter[2], {'id': 3})
 
+    def test_pickle(self):
+        results = Results([{'id': 1}], 1, facets={'facet_fields': {}}, qtime=3)
+
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            unpickled = pickle.loads(pickle.dumps(results, protocol))
+            self.assertEqual(unpickled.docs, [{'id': 1}])
+            self.assertEqual(unpickled.hits, 1)
+            self.assertEqual(unpickled.facets, {'facet_fields': {}})
+            self.assertEqual(unpickled.qtime, 3)
+            self.assertEqual(unpickled.highlighting, {})
+            self.assertEqual(unpickled.nextCursorMark, None)
+
 
 class SolrTestCase(unittest.TestCase):
     def setUp(self):
@@ -167,6 +211,40 @@ class SolrTestCase(unittest.TestCase):
         self.assertEqual(self.solr.url, 'http://localhost:8983/solr/core0')
         self.assertTrue(isinstance(self.solr.decoder, json.JSONDecoder))
         self.assertEqual(self.solr.timeout, 2)
+        self.assertTrue(isinstance(self.solr.session, requests.Session))
+
+        session = requests.Session()
+        session_solr = Solr('http://localhost:8983/solr/core0', session=session)
+        self.assertTrue(session_solr.session is session)
+
+    def test_close(self):
+        class RecordingSession(requests.Session):
+            closed = False
+
+            def close(self):
+                self.closed = True
+                super(RecordingSession, self).close()
+
+        session = RecordingSession()
+        solr = Solr('http://localhost:8983/solr/core0', session=session)
+        solr.close()
+        self.assertTrue(session.closed)
+
+        session = RecordingSession()
+
+        with Solr('http://localhost:8983/solr/core0', session=session) as solr:
+            self.assertTrue(isinstance(solr, Solr))
+            self.assertFalse(session.closed)
+
+        self.assertTrue(session.closed)
+
+        session = RecordingSession()
+
+        with SolrCoreAdmin('http://localhost:8983/solr/admin/cores', session=session) as admin:
+            self.assertTrue(admin.session is session)
+            self.assertFalse(session.closed)
+
+        self.assertTrue(session.closed)
 
     def test__create_full_url(self):
         # Nada.
@@ -201,6 +279,41 @@ class SolrTestCase(unittest.TestCase):
         finally:
             self.solr.url = old_url
 
+    def test__send_request_log_body(self):
+        class FakeResponse(object):
+            status_code = 200
+            content = b'{}'
+
+        class FakeSession(object):
+            def post(self, url, **kwargs):
+                return FakeResponse()
+
+        class RecordingHandler(logging.Handler):
+            def __init__(self):
+                logging.Handler.__init__(self)
+                self.messages = []
+
+            def emit(self, record):
+                self.messages.append(record.getMessage())
+
+        handler = RecordingHandler()
+        log = self.solr.log
+        old_level = log.level
+        log.addHandler(handler)
+        log.setLevel(logging.DEBUG)
+
+        try:
+            solr = Solr('http://localhost:8983/solr/core0', session=FakeSession())
+            solr._send_request('post', 'update/', body=b'<add><doc><field>\xe2\x98\x83</field></doc></add>')
+            solr._send_request('post', 'update/', body='<add>\u2603</add>')
+        finally:
+            log.removeHandler(handler)
+            log.setLevel(old_level)
+
+        self.assertTrue("with body '<add><doc>'" in handler.messages[0])
+        self.assertTrue("with body '<add><doc>'" in handler.messages[1])
+        self.assertTrue("with body '<add>\u2603</ad'" in handler.messages[2])
+
     def test__select(self):
         # Short params.
         resp_body = self.solr._select({'q': 'doc'})
@@ -240,6 +353,29 @@ class SolrTestCase(unittest.TestCase):
         resp_body = self.solr._update(xml_body, softCommit=True)
         self.assertTrue('<int name="status">0</int>' in resp_body)
 
+    def test__decode_response(self):
+        class FakeOrjson(object):
+            @staticmethod
+            def loads(data):
+                if 'NaN' in data:
+                    raise ValueError("NaN isn't valid JSON")
+
+                return {'decoded_by': 'orjson'}
+
+        original_orjson = pysolr.orjson
+        pysolr.orjson = FakeOrjson
+
+        try:
+            self.solr.use_orjson = True
+            self.assertEqual(self.solr._decode_response('{"a": 1}'), {'decoded_by': 'orjson'})
+            # Whatever orjson rejects falls back to the configured decoder.
+            self.assertTrue(math.isnan(self.solr._decode_response('{"max": NaN}')['max']))
+
+            self.solr.use_orjson = False
+            self.assertEqual(self.solr._decode_response('{"a": 1}'), {'a': 1})
+        finally:
+            pysolr.orjson = original_orjson
+
     def test__extract_error(self):
         class RubbishResponse(object):
             def __init__(self, content, headers=None):
@@ -283,6 +419,10 @@ class SolrTestCase(unittest.TestCase):
         resp_2 = self.solr._scrape_response({'server': 'crapzilla'}, '<html><head><title>Wow. Seriously weird.</title></head><body><pre>Something is broke.</pre></body></html>')
         self.assertEqual(resp_2, ('Wow. Seriously weird.', u''))
 
+        # Entities in the message are decoded.
+        resp_3 = self.solr._scrape_response({'server': 'jetty'}, '<html><body><pre>Bread &amp; butter broke.</pre></body></html>')
+        self.assertEqual(resp_3, ('Bread & butter broke.', u''))
+
     @unittest.skipIf(sys.version_info < (2, 7), reason=u'Python 2.6 lacks the ElementTree 1.3 interface required for Solr XML error message parsing')
     def test__scrape_response_coyote_xml(self):
         resp_3 = self.solr._scrape_response({'server': 'coyote'}, '<?xml version="1.0"?>\n<response>\n<lst name="responseHeader"><int name="status">400</int><int name="QTime">0</int></lst><lst name="error"><str name="msg">Invalid Date String:\'2015-03-23 10:43:33\'</str><int name="code">400</int></lst>\n</response>\n')
@@ -322,6 +462,8 @@ class SolrTestCase(unittest.TestCase):
     def test__to_python(self):
         self.assertEqual(self.solr._to_python('2013-01-18T00:00:00Z'), datetime.datetime(2013, 1, 18))
         self.assertEqual(self.solr._to_python('2013-01-18T00:30:28Z'), datetime.datetime(2013, 1, 18, 0, 30, 28))
+        self.assertEqual(self.solr._to_python('2013-01-18T00:30:28.123Z'), datetime.datetime(2013, 1, 18, 0, 30, 28))
+        self.assertEqual(self.solr._to_python('2013-01-18T00:30:28Z\n'), datetime.datetime(2013, 1, 18, 0, 30, 28))
         self.assertEqual(self.solr._to_python('true'), True)
         self.assertEqual(self.solr._to_python('false'), False)
         self.assertEqual(self.solr._to_python(1), 1)
@@ -331,6 +473,27 @@ class SolrTestCase(unittest.TestCase):
         self.assertEqual(self.solr._to_python(['foo', 'bar']), 'foo')
         self.assertEqual(self.solr._to_python(('foo', 'bar')), 'foo')
         self.assertEqual(self.solr._to_python('tuple("foo", "bar")'), 'tuple("foo", "bar")')
+        self.assertEqual(self.solr._to_python('-42'), -42)
+        self.assertEqual(self.solr._to_python('4.5'), 4.5)
+
+        if hasattr(sys, 'get_int_max_str_digits'):
+            # Too many digits for ``int()``, so it's left as a string.
+            long_digits = '1' * (sys.get_int_max_str_digits() + 1)
+            self.assertEqual(self.solr._to_python(long_digits), long_digits)
+        # Repeat conversions are cached, but mutable results are never shared.
+        self.assertEqual(self.solr._to_python('2013-01-18T00:30:28Z'), datetime.datetime(2013, 1, 18, 0, 30, 28))
+        self.assertEqual(self.solr._to_python('[1, 2]'), [1, 2])
+        self.assertFalse(self.solr._to_python('[1, 2]') is self.solr._to_python('[1, 2]'))
+
+        # Each instance has its own cache, so overrides don't leak between classes.
+        class UpperSolr(Solr):
+            def _string_to_python(self, value):
+                return value.upper()
+
+        upper_solr = UpperSolr('http://localhost:8983/solr/core0')
+        self.assertEqual(self.solr._to_python('hello'), 'hello')
+        self.assertEqual(upper_solr._to_python('hello'), 'HELLO')
+        self.assertEqual(self.solr._to_python('hello'), 'hello')
 
     def test__is_null_value(self):
         self.assertTrue(self.solr._is_null_value(None))
@@ -393,6 +556,55 @@ class SolrTestCase(unittest.TestCase):
         self.assertTrue('<field name="id">doc_1</field>' in doc_xml)
         self.assertEqual(len(doc_xml), 152)
 
+    def test__build_doc_xml(self):
+        doc = {
+            'id': 'doc_1',
+            'title': 'Example doc ☃ 1 & <friends>',
+            'price': 12.59,
+            'popularity': 10,
+            'tags': ['a', '', None, 'b'],
+        }
+        doc_xml = self.solr._build_doc_xml(doc, boost={'title': 2.0}, fieldUpdates={'tags': 'add'})
+        self.assertTrue('<field name="title" boost="2.0">Example doc ☃ 1 &amp; &lt;friends&gt;</field>' in doc_xml)
+        self.assertTrue('<field name="id">doc_1</field>' in doc_xml)
+        self.assertTrue('<field name="tags" update="add">a</field><field name="tags" update="add">b</field>' in doc_xml)
+
+        # It should describe the same document as ``_build_doc``.
+        doc_elem = ET.fromstring(doc_xml.encode('utf-8'))
+        self.assertEqual([(field.get('name'), field.text) for field in doc_elem],
+                         [(field.get('name'), field.text) for field in self.solr._build_doc(doc)])
+
+    def test_add_with_custom_build_doc(self):
+        class TaggingSolr(Solr):
+            def _build_doc(self, doc, boost=None, fieldUpdates=None):
+                doc_elem = super(TaggingSolr, self)._build_doc(doc, boost=boost, fieldUpdates=fieldUpdates)
+                field = ET.Element('field', name='tag')
+                field.text = 'custom'
+                doc_elem.append(field)
+                return doc_elem
+
+            def _update(self, message, **kwargs):
+                self.sent = force_unicode(sanitize(message) if kwargs['clean_ctrl_chars'] else message)
+
+        solr = TaggingSolr('http://localhost:8983/solr/core0')
+        solr.add([{'id': 'doc_1', 'title': 'Example ☃ doc'}])
+        message = ET.fromstring(force_bytes(solr.sent))
+        self.assertEqual(message.tag, 'add')
+        self.assertEqual(sorted((field.get('name'), field.text) for field in message.find('doc')),
+                         [('id', 'doc_1'), ('tag', 'custom'), ('title', 'Example ☃ doc')])
+
+    def test_add_with_custom_from_python(self):
+        class PlainSolr(Solr):
+            def _from_python(self, value):
+                return "{0}".format(value)
+
+            def _update(self, message, **kwargs):
+                self.sent = force_unicode(sanitize(message) if kwargs['clean_ctrl_chars'] else message)
+
+        solr = PlainSolr('http://localhost:8983/solr/core0')
+        solr.add([{'id': 'a\x00b\x0c', 'title': 'Example & \uffff doc'}])
+        self.assertEqual(solr.sent, '<add><doc><field name="id">ab</field><field name="title">Example &amp;  doc</field></doc></add>')
+
     def test_add(self):
         self.assertEqual(len(self.solr.search('doc')), 3)
         self.assertEqual(len(self.solr.search('example')), 2)
@@ -411,6 +623,34 @@ class SolrTestCase(unittest.TestCase):
         self.assertEqual(len(self.solr.search('doc')), 5)
         self.assertEqual(len(self.solr.search('example')), 3)
 
+    def test_add_many(self):
+        self.assertEqual(len(self.solr.search('doc')), 3)
+
+        self.solr.add_many([
+            [
+                {
+                    'id': 'doc_6',
+                    'title': 'Newly added doc',
+                },
+            ],
+            [
+                {
+                    'id': 'doc_7',
+                    'title': 'Another example doc',
+                },
+                {
+                    'id': 'doc_8',
+                    'title': 'Yet another doc',
+                },
+            ],
+        ], workers=2)
+
+        self.assertEqual(len(self.solr.search('doc')), 6)
+        self.assertEqual(len(self.solr.search('example')), 3)
+
+        self.solr.add_many([[{'id': 'doc_9', 'title': 'Soft doc'}]], softCommit=True)
+        self.assertEqual(len(self.solr.search('doc')), 7)
+
     def test_add_with_boost(self):
         self.assertEqual(len(self.solr.search('doc')), 3)
 